@@ -1,5 +1,7 @@
 from __future__ import annotations
 
+import base64
+import hashlib
 import io
 import json
 import tarfile
@@ -7,6 +9,8 @@ from typing import TYPE_CHECKING, Callable
 
 import pytest
 
+from vercel_cli import vendor_update
+
 if TYPE_CHECKING:
     from pathlib import Path
 
@@ -50,3 +54,66 @@ def mk_pkg_tgz() -> Callable[[Path, str, dict[str, bytes] | None], Path]:
         return tar_path
 
     return _make
+
+
+@pytest.fixture
+def tgz_hashes() -> Callable[[Path], tuple[str, str]]:
+    def _hashes(tar_path: Path) -> tuple[str, str]:
+        """Compute npm's dist hashes for a tarball.
+
+        Returns:
+            tuple[str, str]: The SHA-512 integrity and the SHA-1 shasum.
+
+        """
+        data = tar_path.read_bytes()
+        digest = hashlib.sha512(data).digest()
+        integrity = "sha512-" + base64.b64encode(digest).decode()
+        return integrity, hashlib.sha1(data).hexdigest()
+
+    return _hashes
+
+
+@pytest.fixture(params=["data_filter", "fallback"])
+def extraction_mode(
+    request: pytest.FixtureRequest, monkeypatch: pytest.MonkeyPatch
+) -> str:
+    """Run a test with tarfile's data filter and again with the manual loop.
+
+    Returns:
+        str: The extraction mode in use.
+
+    """
+    if request.param == "fallback":
+        monkeypatch.delattr(tarfile, "data_filter", raising=False)
+    return request.param
+
+
+@pytest.fixture(params=["vendor", "staged"])
+def failing_rename(
+    request: pytest.FixtureRequest, monkeypatch: pytest.MonkeyPatch
+) -> str:
+    """Make one of update_vendor's two swap renames raise OSError.
+
+    "vendor" fails moving the old VENDOR_DIR aside and "staged" fails moving
+    the staged tree onto VENDOR_DIR.
+
+    Returns:
+        str: The rename that fails.
+
+    """
+    path_cls = type(vendor_update.VENDOR_DIR)
+    real_replace = path_cls.replace
+
+    def fake_replace(self: Path, target: Path) -> Path:
+        vendor_dir = vendor_update.VENDOR_DIR
+        if request.param == "vendor":
+            failing = self == vendor_dir
+        else:
+            failing = self.name == "package" and target == vendor_dir
+        if failing:
+            msg = "rename failed"
+            raise OSError(msg)
+        return real_replace(self, target)
+
+    monkeypatch.setattr(path_cls, "replace", fake_replace)
+    return request.param
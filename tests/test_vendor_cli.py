@@ -20,14 +20,17 @@ def test_vendor_cli_check_sets_outputs_and_logs(
     monkeypatch.setattr(
         vendor_cli, "read_vendored_version", MagicMock(return_value="1.0.0")
     )
+    latest_meta = {"version": "1.2.3", "dist": {"integrity": "sha512-AAAA"}}
     monkeypatch.setattr(
-        vendor_cli, "resolve_latest_version", MagicMock(return_value="1.2.3")
+        vendor_cli, "resolve_latest_metadata", MagicMock(return_value=latest_meta)
     )
 
-    called: dict[str, str] = {}
+    called: dict[str, object] = {}
 
-    def fake_update(version: str) -> None:
+    def fake_update(version: str, metadata: dict[str, object] | None = None) -> str:
         called["update"] = version
+        called["metadata"] = metadata
+        return version
 
     monkeypatch.setattr(vendor_cli, "update_vendor", fake_update)
 
@@ -41,18 +44,23 @@ def test_vendor_cli_check_sets_outputs_and_logs(
     assert "updated=true" in content
     assert "new_version=1.2.3" in content
     assert called.get("update") == "1.2.3"
+    assert called.get("metadata") is latest_meta
 
 
 def test_vendor_cli_update_latest(
     monkeypatch: pytest.MonkeyPatch, tmp_path: Path, caplog: pytest.LogCaptureFixture
 ) -> None:
     caplog.set_level(logging.INFO, logger=vendor_cli.__name__)
-    monkeypatch.setattr(vendor_cli, "resolve_latest_version", lambda: "2.0.0")
+    monkeypatch.setattr(
+        vendor_cli, "resolve_latest_metadata", lambda: {"version": "2.0.0"}
+    )
 
     updated: dict[str, str] = {}
 
-    def fake_update(version: str) -> None:
+    def fake_update(version: str, metadata: dict[str, str] | None = None) -> str:
+        assert metadata == {"version": "2.0.0"}
         updated["v"] = version
+        return version
 
     monkeypatch.setattr(vendor_cli, "update_vendor", fake_update)
 
@@ -75,10 +83,12 @@ def test_vendor_cli_main_invokes_subcommands(
 ) -> None:
     caplog.set_level("INFO", logger=vendor_cli.__name__)
     monkeypatch.setattr(
-        vendor_cli, "resolve_latest_version", MagicMock(return_value="3.3.3")
+        vendor_cli,
+        "resolve_latest_metadata",
+        MagicMock(return_value={"version": "3.3.3"}),
     )
 
-    monkeypatch.setattr(vendor_cli, "update_vendor", MagicMock())
+    monkeypatch.setattr(vendor_cli, "update_vendor", MagicMock(return_value="3.3.3"))
     with pytest.raises(SystemExit) as ei:
         vendor_cli.main(["update", "latest"])
     assert ei.value.code == 0
@@ -88,8 +98,22 @@ def test_vendor_cli_main_invokes_subcommands(
         vendor_cli, "read_vendored_version", MagicMock(return_value="1.0.0")
     )
     monkeypatch.setattr(
-        vendor_cli, "resolve_latest_version", MagicMock(return_value="1.0.0")
+        vendor_cli,
+        "resolve_latest_metadata",
+        MagicMock(return_value={"version": "1.0.0"}),
     )
     with pytest.raises(SystemExit) as ei2:
         vendor_cli.main(["check"])
     assert ei2.value.code == 0
+
+
+def test_vendor_cli_update_reports_resolved_version(
+    monkeypatch: pytest.MonkeyPatch, tmp_path: Path
+) -> None:
+    monkeypatch.setattr(vendor_cli, "update_vendor", MagicMock(return_value="46.1.0"))
+    out_file = tmp_path / "gha.out"
+    monkeypatch.setenv("GITHUB_OUTPUT", str(out_file))
+
+    rc = vendor_cli.cmd_update(argparse.Namespace(version="46", github_outputs=True))
+    assert rc == 0
+    assert "new_version=46.1.0" in out_file.read_text()
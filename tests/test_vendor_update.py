@@ -1,12 +1,11 @@
 from __future__ import annotations
 
-import base64
-import hashlib
 import io
 import json
+import os
 import tarfile
 from types import SimpleNamespace
-from typing import TYPE_CHECKING, Callable
+from typing import TYPE_CHECKING, Any, Callable
 from unittest.mock import MagicMock
 
 import pytest
@@ -23,6 +22,13 @@ from vercel_cli.vendor_update import (
 if TYPE_CHECKING:
     from pathlib import Path
 
+# Vendored package.json whose dependencies match mk_pkg_tgz's once sanitized
+_VENDORED_PKG: dict[str, Any] = {
+    "version": "9.9.8",
+    "dependencies": {"@vercel/build-utils": "11.0.2", "@vercel/python": "5.0.0"},
+}
+_NO_HASH_METADATA = {"version": "9.9.9", "dist": {"integrity": None, "shasum": None}}
+
 
 def _make_tgz_with_file(tmp_path: Path, members: dict[str, bytes]) -> Path:
     tar_path = tmp_path / "pkg.tgz"
@@ -50,7 +56,7 @@ def test_npm_pack_error(monkeypatch: pytest.MonkeyPatch, tmp_path: Path) -> None
     assert "npm pack failed" in str(ei.value)
 
 
-def test_npm_pack_fallback_to_glob(
+def test_npm_pack_falls_back_to_directory_scan(
     monkeypatch: pytest.MonkeyPatch, tmp_path: Path
 ) -> None:
     out_dir = tmp_path / "out"
@@ -60,13 +66,27 @@ def test_npm_pack_fallback_to_glob(
 
     class FakeCompleted:
         returncode = 0
-        stdout = b""  # empty => triggers glob fallback
+        stdout = b""  # empty => triggers the directory scan
 
     monkeypatch.setattr(vendor_update, "npm", MagicMock(return_value=FakeCompleted()))
     p = vendor_update.npm_pack("1.2.3", out_dir)
     assert p == fallback
 
 
+def test_npm_pack_no_tarball(monkeypatch: pytest.MonkeyPatch, tmp_path: Path) -> None:
+    out_dir = tmp_path / "empty"
+    out_dir.mkdir()
+    (out_dir / "notes.txt").write_text("x")
+
+    class FakeCompleted:
+        returncode = 0
+        stdout = b""
+
+    monkeypatch.setattr(vendor_update, "npm", MagicMock(return_value=FakeCompleted()))
+    with pytest.raises(RuntimeError, match="did not produce a tarball"):
+        vendor_update.npm_pack("1.2.3", out_dir)
+
+
 def test_npm_pack_uses_stdout_filename(
     monkeypatch: pytest.MonkeyPatch, tmp_path: Path
 ) -> None:
@@ -84,14 +104,12 @@ def test_npm_pack_uses_stdout_filename(
     assert got == fname
 
 
-def test_verify_tgz_integrity_success_and_failure(tmp_path: Path) -> None:
+def test_verify_tgz_integrity_success_and_failure(
+    tmp_path: Path, tgz_hashes: Callable[[Path], tuple[str, str]]
+) -> None:
     tar_path = _make_tgz_with_file(tmp_path, {"package/file.txt": b"hello"})
 
-    h = hashlib.sha512()
-    with tar_path.open("rb") as f:
-        for chunk in iter(lambda: f.read(8192), b""):
-            h.update(chunk)
-    integrity = "sha512-" + base64.b64encode(h.digest()).decode()
+    integrity, _ = tgz_hashes(tar_path)
 
     verify_tgz(tar_path, integrity=integrity, shasum=None)
 
@@ -99,15 +117,14 @@ def test_verify_tgz_integrity_success_and_failure(tmp_path: Path) -> None:
         verify_tgz(tar_path, integrity="sha512-AAAA", shasum=None)
 
 
-def test_verify_tgz_with_shasum(tmp_path: Path) -> None:
+def test_verify_tgz_with_shasum(
+    tmp_path: Path, tgz_hashes: Callable[[Path], tuple[str, str]]
+) -> None:
     content = {"package/file.txt": b"hello"}
     tar_path = _make_tgz_with_file(tmp_path, content)
 
-    h = hashlib.sha1()
-    with tar_path.open("rb") as f:
-        for chunk in iter(lambda: f.read(8192), b""):
-            h.update(chunk)
-    verify_tgz(tar_path, integrity=None, shasum=h.hexdigest())
+    _, shasum = tgz_hashes(tar_path)
+    verify_tgz(tar_path, integrity=None, shasum=shasum)
 
     with pytest.raises(RuntimeError):
         verify_tgz(tar_path, integrity=None, shasum="deadbeef")
@@ -117,7 +134,7 @@ def test_verify_tgz_unsupported_algo(
     tmp_path: Path, mk_pkg_tgz: Callable[[Path, str], Path]
 ) -> None:
     tar_path = mk_pkg_tgz(tmp_path, "1.0.0")
-    with pytest.raises(RuntimeError):
+    with pytest.raises(RuntimeError, match="Unsupported integrity algorithm"):
         vendor_update.verify_tgz(tar_path, integrity="foo-AAAA", shasum=None)
 
 
@@ -125,8 +142,9 @@ def test_verify_tgz_invalid_integrity_format(
     tmp_path: Path, mk_pkg_tgz: Callable[[Path, str], Path]
 ) -> None:
     tar_path = mk_pkg_tgz(tmp_path, "1.0.0")
-    with pytest.raises(RuntimeError):
-        vendor_update.verify_tgz(tar_path, integrity="sha512", shasum=None)
+    for integrity in ("sha512", "sha512-AAA"):
+        with pytest.raises(RuntimeError, match="Invalid integrity"):
+            vendor_update.verify_tgz(tar_path, integrity=integrity, shasum=None)
 
 
 def test_verify_tgz_shasum_mismatch(
@@ -142,6 +160,11 @@ def test_decode_maybe_bytes_varixants() -> None:
     assert vendor_update.decode_maybe_bytes(b"abc") == "abc"
     assert vendor_update.decode_maybe_bytes("xyz") == "xyz"
 
+    class Raw(bytes):
+        pass
+
+    assert vendor_update.decode_maybe_bytes(Raw(b"sub")) == "sub"
+
 
 def test_safe_target_path_basics(tmp_path: Path) -> None:
     dest = tmp_path
@@ -150,8 +173,14 @@ def test_safe_target_path_basics(tmp_path: Path) -> None:
     assert safe_target_path("package/.. /x", dest) is None
     assert safe_target_path("package/..", dest) is None
     assert safe_target_path("package/", dest) is None
+    assert safe_target_path("package//etc/passwd", dest) is None
+    assert safe_target_path("package/a/../b", dest) is None
+    assert safe_target_path("package/a\\..\\b", dest) is None
+    assert safe_target_path("package/a /b", dest) is None
+    assert safe_target_path("package/a b/.c", dest) == dest / "a b" / ".c"
 
 
+@pytest.mark.usefixtures("extraction_mode")
 def test_extract_tgz_skips_links(tmp_path: Path) -> None:
     tar_path = tmp_path / "l.tgz"
     with tarfile.open(tar_path, "w:gz") as tf:
@@ -198,24 +227,16 @@ def test_update_vendor_happy_path(
     monkeypatch: pytest.MonkeyPatch,
     tmp_path: Path,
     mk_pkg_tgz: Callable[[Path, str], Path],
+    tgz_hashes: Callable[[Path], tuple[str, str]],
 ) -> None:
     tgz = mk_pkg_tgz(tmp_path, "9.9.9")
 
-    h = hashlib.sha512()
-    with tgz.open("rb") as f:
-        for chunk in iter(lambda: f.read(8192), b""):
-            h.update(chunk)
-    integrity = "sha512-" + base64.b64encode(h.digest()).decode()
-    sh = hashlib.sha1()
-    with tgz.open("rb") as f:
-        for chunk in iter(lambda: f.read(8192), b""):
-            sh.update(chunk)
-    shasum = sh.hexdigest()
+    integrity, _ = tgz_hashes(tgz)
 
     monkeypatch.setattr(
         vendor_update,
         "npm_view",
-        MagicMock(return_value={"dist": {"integrity": integrity, "shasum": shasum}}),
+        MagicMock(return_value={"dist": {"integrity": integrity}}),
     )
     monkeypatch.setattr(vendor_update, "npm_pack", MagicMock(return_value=tgz))
     monkeypatch.setattr(
@@ -223,7 +244,7 @@ def test_update_vendor_happy_path(
     )
     monkeypatch.setattr(vendor_update, "VENDOR_DIR", tmp_path / "vendor")
 
-    vendor_update.update_vendor("9.9.9")
+    assert vendor_update.update_vendor("9.9.9") == "9.9.9"
 
     pkg = json.loads((vendor_update.VENDOR_DIR / "package.json").read_text())
     assert pkg["version"] == "9.9.9"
@@ -232,7 +253,9 @@ def test_update_vendor_happy_path(
 
 
 def test_update_vendor_handles_invalid_json_and_cleans(
-    monkeypatch: pytest.MonkeyPatch, tmp_path: Path
+    monkeypatch: pytest.MonkeyPatch,
+    tmp_path: Path,
+    tgz_hashes: Callable[[Path], tuple[str, str]],
 ) -> None:
     tar_path = tmp_path / "bad.tgz"
     with tarfile.open(tar_path, "w:gz") as tf:
@@ -245,21 +268,12 @@ def test_update_vendor_handles_invalid_json_and_cleans(
         info.size = len(body)
         tf.addfile(info, io.BytesIO(body))
 
-    h = hashlib.sha512()
-    with tar_path.open("rb") as f:
-        for chunk in iter(lambda: f.read(8192), b""):
-            h.update(chunk)
-    integrity = "sha512-" + base64.b64encode(h.digest()).decode()
-    sh = hashlib.sha1()
-    with tar_path.open("rb") as f:
-        for chunk in iter(lambda: f.read(8192), b""):
-            sh.update(chunk)
-    shasum = sh.hexdigest()
+    integrity, _ = tgz_hashes(tar_path)
 
     monkeypatch.setattr(
         vendor_update,
         "npm_view",
-        MagicMock(return_value={"dist": {"integrity": integrity, "shasum": shasum}}),
+        MagicMock(return_value={"dist": {"integrity": integrity}}),
     )
     monkeypatch.setattr(vendor_update, "npm_pack", MagicMock(return_value=tar_path))
     monkeypatch.setattr(
@@ -269,10 +283,246 @@ def test_update_vendor_handles_invalid_json_and_cleans(
     vdir = tmp_path / "vendor"
     (vdir / "old_dir").mkdir(parents=True)
     (vdir / "old_file.txt").write_text("x")
+    (vdir / ".gitkeep").write_text("")
     monkeypatch.setattr(vendor_update, "VENDOR_DIR", vdir)
 
     vendor_update.update_vendor("0.0.1")
 
     assert not (vdir / "old_dir").exists()
     assert not (vdir / "old_file.txt").exists()
+    assert (vdir / ".gitkeep").exists()
     assert (vdir / "index.js").exists()
+
+
+def test_extract_and_verify_success_and_rollback(
+    tmp_path: Path, tgz_hashes: Callable[[Path], tuple[str, str]]
+) -> None:
+    tar_path = _make_tgz_with_file(tmp_path, {"package/file.txt": b"hello"})
+    integrity, _ = tgz_hashes(tar_path)
+
+    out = tmp_path / "ok"
+    vendor_update.extract_and_verify(tar_path, out, integrity=integrity, shasum=None)
+    assert (out / "file.txt").read_bytes() == b"hello"
+
+    bad = tmp_path / "bad"
+    with pytest.raises(RuntimeError):
+        vendor_update.extract_and_verify(
+            tar_path, bad, integrity=None, shasum="deadbeef"
+        )
+    assert not bad.exists()
+
+
+@pytest.mark.parametrize("hashed", [True, False])
+def test_extract_and_verify_removes_dest_on_truncated_tarball(
+    tmp_path: Path, tgz_hashes: Callable[[Path], tuple[str, str]], *, hashed: bool
+) -> None:
+    tar_path = _make_tgz_with_file(
+        tmp_path, {"package/a.js": b"a", "package/b.js": os.urandom(200_000)}
+    )
+    data = tar_path.read_bytes()
+    tar_path.write_bytes(data[: len(data) // 2])
+    # Hash the truncated file so that extraction, not verification, fails
+    integrity = tgz_hashes(tar_path)[0] if hashed else None
+
+    out = tmp_path / "out"
+    with pytest.raises(tarfile.ReadError):
+        vendor_update.extract_and_verify(tar_path, out, integrity=integrity)
+    assert not out.exists()
+
+
+def test_npm_view_parses_without_orjson(monkeypatch: pytest.MonkeyPatch) -> None:
+    payload = b'{"version": "1.2.3", "dist": {"shasum": "abc"}}'
+    monkeypatch.setattr(
+        vendor_update, "npm", MagicMock(return_value=SimpleNamespace(stdout=payload))
+    )
+    expected = {"version": "1.2.3", "dist": {"shasum": "abc"}}
+    assert vendor_update.npm_view("1.2.3") == expected
+    monkeypatch.setattr(vendor_update, "orjson", None)
+    assert vendor_update.npm_view("1.2.3") == expected
+
+
+def test_npm_view_requests_dist_and_version(monkeypatch: pytest.MonkeyPatch) -> None:
+    payload = b'{"version": "1.2.3", "dist": {"shasum": "abc"}}'
+    fake_npm = MagicMock(return_value=SimpleNamespace(stdout=payload))
+    monkeypatch.setattr(vendor_update, "npm", fake_npm)
+    assert set(vendor_update.npm_view("1.2.3")) == {"dist", "version"}
+    args = fake_npm.call_args.args[0]
+    assert args[:2] == ["view", "vercel@1.2.3"]
+    assert set(args[2:]) == {"dist", "version", "--json"}
+
+
+def test_read_vendored_version(monkeypatch: pytest.MonkeyPatch, tmp_path: Path) -> None:
+    (tmp_path / "package.json").write_bytes(b'{"name": "vercel", "version": "7.8.9"}')
+    monkeypatch.setattr(vendor_update, "VENDOR_DIR", tmp_path)
+    assert vendor_update.read_vendored_version() == "7.8.9"
+    monkeypatch.setattr(vendor_update, "orjson", None)
+    assert vendor_update.read_vendored_version() == "7.8.9"
+
+    pretty = json.dumps(
+        {"engines": {"version": "0.0.0"}, "name": "vercel", "version": "7.9.0"},
+        indent=2,
+    )
+    (tmp_path / "package.json").write_text(pretty)
+    assert vendor_update.read_vendored_version() == "7.9.0"
+
+
+def test_npm_view_single_field(monkeypatch: pytest.MonkeyPatch) -> None:
+    fake_npm = MagicMock(return_value=SimpleNamespace(stdout=b'"4.5.6"\n'))
+    monkeypatch.setattr(vendor_update, "npm", fake_npm)
+    assert vendor_update.resolve_latest_version() == "4.5.6"
+    assert fake_npm.call_args.args[0] == ["view", "vercel@latest", "version", "--json"]
+
+
+@pytest.mark.usefixtures("extraction_mode")
+def test_extract_tgz_nested_directories(tmp_path: Path) -> None:
+    tar_path = _make_tgz_with_file(
+        tmp_path,
+        {
+            "package/dist/a.js": b"a",
+            "package/dist/b.js": b"b",
+            "package/dist/sub/c.js": b"c",
+        },
+    )
+    out = tmp_path / "out"
+    extract_tgz(tar_path, out)
+    assert (out / "dist" / "a.js").read_bytes() == b"a"
+    assert (out / "dist" / "b.js").read_bytes() == b"b"
+    assert (out / "dist" / "sub" / "c.js").read_bytes() == b"c"
+
+
+def test_update_vendor_reuses_metadata(
+    monkeypatch: pytest.MonkeyPatch,
+    tmp_path: Path,
+    mk_pkg_tgz: Callable[[Path, str], Path],
+    tgz_hashes: Callable[[Path], tuple[str, str]],
+) -> None:
+    tgz = mk_pkg_tgz(tmp_path, "9.9.9")
+    integrity, _ = tgz_hashes(tgz)
+    view = MagicMock()
+    monkeypatch.setattr(vendor_update, "npm_view", view)
+    monkeypatch.setattr(vendor_update, "npm_pack", MagicMock(return_value=tgz))
+    monkeypatch.setattr(
+        vendor_update, "npm", MagicMock(return_value=SimpleNamespace(returncode=0))
+    )
+    monkeypatch.setattr(vendor_update, "VENDOR_DIR", tmp_path / "vendor")
+
+    metadata = {"version": "9.9.9", "dist": {"integrity": integrity, "shasum": None}}
+    assert vendor_update.update_vendor("9.9.9", metadata=metadata) == "9.9.9"
+
+    view.assert_not_called()
+    assert (vendor_update.VENDOR_DIR / "index.js").exists()
+
+
+def test_update_vendor_npm_install_failure(
+    monkeypatch: pytest.MonkeyPatch,
+    tmp_path: Path,
+    mk_pkg_tgz: Callable[[Path, str], Path],
+) -> None:
+    tgz = mk_pkg_tgz(tmp_path, "9.9.9")
+    monkeypatch.setattr(vendor_update, "npm_pack", MagicMock(return_value=tgz))
+    monkeypatch.setattr(
+        vendor_update,
+        "npm",
+        MagicMock(return_value=SimpleNamespace(returncode=1, stderr=b"ERESOLVE")),
+    )
+    vdir = tmp_path / "vendor"
+    (vdir / "dist").mkdir(parents=True)
+    monkeypatch.setattr(vendor_update, "VENDOR_DIR", vdir)
+
+    metadata = {"version": "9.9.9", "dist": {"integrity": None, "shasum": None}}
+    with pytest.raises(RuntimeError, match="ERESOLVE"):
+        vendor_update.update_vendor("9.9.9", metadata=metadata)
+    assert (vdir / "dist").exists()
+
+
+def test_update_vendor_reuses_node_modules_when_deps_unchanged(
+    monkeypatch: pytest.MonkeyPatch,
+    tmp_path: Path,
+    mk_pkg_tgz: Callable[[Path, str], Path],
+) -> None:
+    tgz = mk_pkg_tgz(tmp_path, "9.9.9")
+    monkeypatch.setattr(vendor_update, "npm_pack", MagicMock(return_value=tgz))
+    fake_npm = MagicMock(return_value=SimpleNamespace(returncode=0))
+    monkeypatch.setattr(vendor_update, "npm", fake_npm)
+    vdir = tmp_path / "vendor"
+    (vdir / "node_modules" / "@vercel" / "python").mkdir(parents=True)
+    (vdir / "package.json").write_text(json.dumps(_VENDORED_PKG))
+    monkeypatch.setattr(vendor_update, "VENDOR_DIR", vdir)
+
+    vendor_update.update_vendor("9.9.9", metadata=_NO_HASH_METADATA)
+
+    fake_npm.assert_not_called()
+    assert (vdir / "node_modules" / "@vercel" / "python").is_dir()
+    assert vendor_update.read_vendored_version() == "9.9.9"
+
+    # A dependency change falls back to a full install
+    (vdir / "package.json").write_text(json.dumps({"dependencies": {}}))
+    vendor_update.update_vendor("9.9.9", metadata=_NO_HASH_METADATA)
+    fake_npm.assert_called_once()
+    assert not (vdir / "node_modules").exists()
+
+
+@pytest.mark.usefixtures("failing_rename")
+@pytest.mark.parametrize("reuse", [True, False])
+def test_update_vendor_restores_old_tree_when_swap_fails(
+    monkeypatch: pytest.MonkeyPatch,
+    tmp_path: Path,
+    mk_pkg_tgz: Callable[[Path, str], Path],
+    *,
+    reuse: bool,
+) -> None:
+    tgz = mk_pkg_tgz(tmp_path, "9.9.9")
+    monkeypatch.setattr(vendor_update, "npm_pack", MagicMock(return_value=tgz))
+    fake_npm = MagicMock(return_value=SimpleNamespace(returncode=0))
+    monkeypatch.setattr(vendor_update, "npm", fake_npm)
+    vdir = tmp_path / "vendor"
+    (vdir / "node_modules" / "@vercel" / "python").mkdir(parents=True)
+    (vdir / ".gitkeep").write_text("")
+    # Matching dependencies make update_vendor reuse node_modules
+    old_pkg: dict[str, Any] = (
+        _VENDORED_PKG if reuse else {"version": "9.9.8", "dependencies": {}}
+    )
+    (vdir / "package.json").write_text(json.dumps(old_pkg))
+    monkeypatch.setattr(vendor_update, "VENDOR_DIR", vdir)
+
+    with pytest.raises(OSError, match="rename failed"):
+        vendor_update.update_vendor("9.9.9", metadata=_NO_HASH_METADATA)
+    assert fake_npm.called is not reuse
+    assert (vdir / "node_modules" / "@vercel" / "python").is_dir()
+    assert (vdir / ".gitkeep").exists()
+    assert not (vdir / "index.js").exists()
+    assert vendor_update.read_vendored_version() == "9.9.8"
+
+
+@pytest.mark.usefixtures("extraction_mode")
+def test_extract_tgz_sanitizes_package_json(
+    tmp_path: Path, mk_pkg_tgz: Callable[[Path, str], Path]
+) -> None:
+    tgz = mk_pkg_tgz(tmp_path, "1.0.0")
+    out = tmp_path / "out"
+    extract_tgz(tgz, out, sanitize_package_json=True)
+    pkg = json.loads((out / "package.json").read_text())
+    assert "devDependencies" not in pkg
+    assert set(pkg["dependencies"]) <= ALLOWED_RUNTIME_DEPENDENCIES
+    assert (out / "index.js").exists()
+
+
+@pytest.mark.usefixtures("extraction_mode")
+def test_extract_tgz_sanitizes_package_json_without_orjson(
+    monkeypatch: pytest.MonkeyPatch, tmp_path: Path
+) -> None:
+    payload = {"name": "vercel", "description": "Déploiement", "version": "1.0.0"}
+    tgz = _make_tgz_with_file(
+        tmp_path,
+        {"package/package.json": json.dumps(payload, ensure_ascii=False).encode()},
+    )
+    with_orjson = tmp_path / "with_orjson"
+    extract_tgz(tgz, with_orjson, sanitize_package_json=True)
+    monkeypatch.setattr(vendor_update, "orjson", None)
+    without_orjson = tmp_path / "without_orjson"
+    extract_tgz(tgz, without_orjson, sanitize_package_json=True)
+
+    written = (without_orjson / "package.json").read_bytes()
+    assert "Déploiement".encode() in written
+    assert json.loads(written) == {**payload, "dependencies": {}}
+    assert written == (with_orjson / "package.json").read_bytes()
@@ -13,6 +13,9 @@ from pathlib import Path
 
 from nodejs_wheel.executable import node
 
+# Resolved once at import rather than on every call
+_JS_CLI = str(Path(__file__).resolve().parent / "vendor" / "dist" / "vc.js")
+
 
 def run_vercel(
     args: list[str] | None = None,
@@ -49,20 +52,15 @@ def run_vercel(
         ```
 
     """
-    here = Path(__file__).resolve().parent
-    js_cli = here / "vendor" / "dist" / "vc.js"
-
     # Determine arguments
     command_args = sys.argv[1:] if args is None else args
 
     # Prepare the full command
-    full_args = [str(js_cli), *command_args]
-
-    # Prepare working directory
-    working_dir = cwd or Path.cwd()
+    full_args = [_JS_CLI, *command_args]
 
+    # With cwd=None the child inherits the current working directory
     try:
-        return node(args=full_args, cwd=working_dir, env=env)
+        return node(args=full_args, cwd=cwd or None, env=env)
     except SystemExit as exc:
         # In case node() raises SystemExit with the code
         return int(exc.code) if exc.code is not None else 1
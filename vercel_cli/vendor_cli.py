@@ -8,7 +8,7 @@ from typing import NoReturn
 
 from .vendor_update import (
     read_vendored_version,
-    resolve_latest_version,
+    resolve_latest_metadata,
     update_vendor,
     write_github_outputs,
 )
@@ -25,9 +25,11 @@ def cmd_update(args: argparse.Namespace) -> int:
 
     """
     version = args.version or "latest"
+    metadata = None
     if version == "latest":
-        version = resolve_latest_version()
-    update_vendor(version=version)
+        metadata = resolve_latest_metadata()
+        version = str(metadata.get("version", ""))
+    version = update_vendor(version=version, metadata=metadata)
     if args.github_outputs:
         write_github_outputs(updated="true", new_version=version)
     logger.info(version)
@@ -42,10 +44,11 @@ def cmd_check(args: argparse.Namespace) -> int:
 
     """
     current = read_vendored_version()
-    latest = resolve_latest_version()
+    latest_meta = resolve_latest_metadata()
+    latest = str(latest_meta.get("version", ""))
     if latest and latest != current:
         if args.vendor:
-            update_vendor(latest)
+            latest = update_vendor(version=latest, metadata=latest_meta)
         if args.github_outputs:
             write_github_outputs(updated="true", new_version=latest)
         logger.info(latest)
@@ -8,19 +8,31 @@ CLI entry points and tests.
 from __future__ import annotations
 
 import base64
+import binascii
 import hashlib
+import io
 import json
 import logging
+import mmap
 import os
+import re
 import shutil
+import subprocess  # noqa: S404 - only for DEVNULL/PIPE passed to npm
+import sys
 import tarfile
 import tempfile
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import suppress
 from pathlib import Path
-from typing import Any
+from typing import Any, Callable, Iterator, Sequence
 
 from nodejs_wheel.executable import npm
 
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is an optional speedup
+    orjson = None
+
 ROOT = Path(__file__).resolve().parents[1]
 VENDOR_DIR = ROOT / "vercel_cli" / "vendor"
 
@@ -30,10 +42,34 @@ logger = logging.getLogger(__name__)
 # Keep the vendored CLI as small as possible: we only need the Python builder
 # and a minimal runtime surface for the CLI itself. These dependency names will
 # be retained from the upstream package.json; all others are dropped.
-ALLOWED_RUNTIME_DEPENDENCIES: set[str] = {
+ALLOWED_RUNTIME_DEPENDENCIES: frozenset[str] = frozenset({
     "@vercel/build-utils",
     "@vercel/detect-agent",
     "@vercel/python",
+})
+
+# npm tarballs store every file under this directory
+_PACKAGE_PREFIX = "package/"
+_PACKAGE_JSON_MEMBER = _PACKAGE_PREFIX + "package.json"
+
+# Absolute/drive-rooted paths, "." or ".." components, and components with
+# leading or trailing whitespace. Both separators are checked for Windows.
+_UNSAFE_MEMBER_PATH = re.compile(
+    r"^[/\\]|^[A-Za-z]:|(?:^|[/\\])(?:\.{1,2}|\s[^/\\]*|[^/\\]*\s)(?:[/\\]|$)"
+)
+
+# Top-level "version" as written by _json_dumps_pretty (two-space indent), so
+# that nested "version" keys never match
+_TOP_LEVEL_VERSION = re.compile(rb'^  "version": ?"([^"\\]+)",?\r?$', re.MULTILINE)
+_VERSION_SCAN_BYTES = 4096
+
+# Subresource Integrity value as published by npm, e.g. "sha512-<base64>"
+_INTEGRITY = re.compile(r"^([A-Za-z0-9]+)-([A-Za-z0-9+/]+={0,2})$")
+_HASH_CTORS: dict[str, Callable[[], Any]] = {
+    "sha1": hashlib.sha1,
+    "sha256": hashlib.sha256,
+    "sha384": hashlib.sha384,
+    "sha512": hashlib.sha512,
 }
 
 
@@ -54,12 +90,8 @@ def sanitize_package_data(pkg_data: dict[str, Any]) -> dict[str, Any]:
     for key in ("packageManager", "pnpm", "workspaces"):
         data.pop(key, None)
     original_deps: dict[str, str] = dict(data.get("dependencies", {}))
-    filtered_deps = {
-        name: version
-        for name, version in original_deps.items()
-        if name in ALLOWED_RUNTIME_DEPENDENCIES
-    }
-    data["dependencies"] = {k: filtered_deps[k] for k in sorted(filtered_deps.keys())}
+    kept = sorted(original_deps.keys() & ALLOWED_RUNTIME_DEPENDENCIES)
+    data["dependencies"] = {name: original_deps[name] for name in kept}
     return data
 
 
@@ -70,6 +102,9 @@ def decode_maybe_bytes(value: bytes | str | None) -> str:
         str: The decoded string.
 
     """
+    # Subprocess output is almost always exact bytes: check that first
+    if type(value) is bytes:
+        return value.decode(errors="replace")
     if value is None:
         return ""
     if isinstance(value, bytes):
@@ -77,6 +112,35 @@ def decode_maybe_bytes(value: bytes | str | None) -> str:
     return str(value)
 
 
+def _json_loads(data: bytes | str) -> Any:  # noqa: ANN401
+    """Parse JSON with orjson when it is installed, falling back to json.
+
+    Returns:
+        Any: The parsed JSON value.
+
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def _json_dumps_pretty(data: Any) -> bytes:  # noqa: ANN401
+    """Serialize JSON with 2-space indentation, sorted keys and a final newline.
+
+    Returns:
+        bytes: The encoded JSON document.
+
+    """
+    if orjson is not None:
+        return (
+            orjson.dumps(data, option=orjson.OPT_INDENT_2 | orjson.OPT_SORT_KEYS)
+            + b"\n"
+        )
+    # ensure_ascii=False matches orjson, which writes non-ASCII as raw UTF-8
+    text = json.dumps(data, indent=2, sort_keys=True, ensure_ascii=False)
+    return (text + "\n").encode()
+
+
 def npm_pack(version: str, out_dir: Path) -> Path:
     """Pack a npm package into a tarball and return its path.
 
@@ -98,17 +162,24 @@ def npm_pack(version: str, out_dir: Path) -> Path:
         stderr = decode_maybe_bytes(getattr(completed, "stderr", b""))
         msg = f"npm pack failed for vercel@{version}: {stderr.strip()}"
         raise RuntimeError(msg)
-    filename = decode_maybe_bytes(getattr(completed, "stdout", b""))
-    filename = filename.strip()
+    # npm prints the tarball name; decode it the way the OS encodes file names
+    filename = os.fsdecode(getattr(completed, "stdout", None) or b"").strip()
     if filename:
         candidate = out_dir / filename
         if candidate.exists():
             return candidate
-    tgzs = list(out_dir.glob("vercel-*.tgz"))
-    if not tgzs:
+    tgz = next(
+        (
+            p
+            for p in out_dir.iterdir()
+            if p.suffix == ".tgz" and p.name.startswith("vercel-")
+        ),
+        None,
+    )
+    if tgz is None:
         msg = f"npm pack did not produce a tarball for vercel@{version}"
         raise RuntimeError(msg)
-    return tgzs[0]
+    return tgz
 
 
 def safe_target_path(member_name: str, dest: Path) -> Path | None:
@@ -118,116 +189,354 @@ def safe_target_path(member_name: str, dest: Path) -> Path | None:
         Path: The safe target path.
 
     """
-    if not member_name.startswith("package/"):
-        return None
-    rel = member_name[len("package/") :]
-    if not rel or rel == ".":
+    rel = _safe_relative_name(member_name)
+    return None if rel is None else dest / rel
+
+
+def _safe_relative_name(member_name: str) -> str | None:
+    """Return member_name without the package/ prefix, or None if unsafe.
+
+    Returns:
+        str | None: The path relative to the package root.
+
+    """
+    if not member_name.startswith(_PACKAGE_PREFIX):
         return None
-    rel_path = Path(rel)
-    if rel_path.is_absolute():
+    rel = member_name[len(_PACKAGE_PREFIX) :]
+    if not rel or _UNSAFE_MEMBER_PATH.search(rel):
         return None
-    for part in rel_path.parts:
-        if part.strip() != part:
-            return None
-        if part.strip() in {".", ".."}:
-            return None
-    return dest / rel_path
+    return rel
+
+
+def _ensure_dir(path: Path, created: set[Path]) -> None:
+    """Create path unless it (or a descendant) was already created."""
+    if path in created:
+        return
+    path.mkdir(parents=True, exist_ok=True)
+    created.add(path)
+    created.update(path.parents)
 
 
-def _extract_member(tf: tarfile.TarFile, member: tarfile.TarInfo, target: Path) -> None:
+def _extract_member(
+    tf: tarfile.TarFile, member: tarfile.TarInfo, target: Path, created: set[Path]
+) -> None:
     if member.isdir():
-        target.mkdir(parents=True, exist_ok=True)
+        _ensure_dir(target, created)
         return
     if member.isreg():
-        target.parent.mkdir(parents=True, exist_ok=True)
+        _ensure_dir(target.parent, created)
         extracted = tf.extractfile(member)
         if extracted is None:
             return
         with target.open("wb") as f:
-            shutil.copyfileobj(extracted, f)
+            shutil.copyfileobj(extracted, f, length=1024 * 1024)
         with suppress(PermissionError):
             target.chmod(member.mode)
         return
 
 
-def extract_tgz(tgz_path: Path, dest: Path) -> None:
-    """Safely extract a tarball into a directory, stripping the package/ prefix."""
+def _package_filter(member: tarfile.TarInfo, dest_path: str) -> tarfile.TarInfo | None:
+    """Tarfile extraction filter stripping the package/ prefix.
+
+    Links are skipped entirely, and members with unsafe names or rejected by
+    tarfile's ``data`` filter are skipped rather than aborting the extraction.
+
+    Returns:
+        TarInfo | None: The member to extract, or None to skip it.
+
+    """
+    if member.issym() or member.islnk():
+        return None
+    rel = _safe_relative_name(member.name)
+    if rel is None:
+        return None
+    member = member.replace(name=rel, deep=False)
+    try:
+        return tarfile.data_filter(member, dest_path)
+    except tarfile.FilterError:
+        return None
+
+
+def _write_sanitized_package_json(
+    tf: tarfile.TarFile, member: tarfile.TarInfo, target: Path
+) -> None:
+    """Write the archive's package.json to target, sanitized in memory."""
+    extracted = tf.extractfile(member)
+    if extracted is None:
+        return
+    raw = extracted.read()
+    try:
+        pkg_data = sanitize_package_data(_json_loads(raw))
+    except Exception as exc:  # noqa: BLE001 - keep the upstream file as-is
+        logger.info("Warning: failed to sanitize package.json: %s", exc)
+        target.write_bytes(raw)
+        return
+    target.write_bytes(_json_dumps_pretty(pkg_data))
+    logger.info(
+        "Restricted dependencies to: %s",
+        ", ".join(sorted(pkg_data["dependencies"].keys())),
+    )
+
+
+def _iter_members(
+    tf: tarfile.TarFile, dest: Path, *, sanitize_package_json: bool
+) -> Iterator[tarfile.TarInfo]:
+    for member in tf:
+        if (
+            sanitize_package_json
+            and member.name == _PACKAGE_JSON_MEMBER
+            and member.isreg()
+        ):
+            _write_sanitized_package_json(tf, member, dest / "package.json")
+            continue
+        yield member
+
+
+def _extract_stream(
+    tf: tarfile.TarFile, dest: Path, *, sanitize_package_json: bool = False
+) -> None:
+    members = _iter_members(tf, dest, sanitize_package_json=sanitize_package_json)
+    # Extraction filters (PEP 706) are available from 3.12 and in security
+    # releases of older versions; they keep the per-member work inside tarfile
+    if hasattr(tarfile, "data_filter"):
+        tf.extractall(dest, members=members, filter=_package_filter)  # noqa: S202 - filtered
+        return
+    # Callers have already created dest, so entries at the top level of
+    # the package never need a mkdir
+    created: set[Path] = {dest, *dest.parents}
+    for member in members:
+        if member.issym() or member.islnk():  # skip links entirely
+            continue
+        target = safe_target_path(member.name, dest)
+        if target is None:
+            continue
+        _extract_member(tf, member, target, created)
+
+
+def extract_tgz(
+    tgz_path: Path, dest: Path, *, sanitize_package_json: bool = False
+) -> None:
+    """Safely extract a tarball into a directory, stripping the package/ prefix.
+
+    With sanitize_package_json, the top-level package.json is passed through
+    sanitize_package_data as it is extracted.
+    """
     dest.mkdir(parents=True, exist_ok=True)
-    with tarfile.open(tgz_path) as tf:
-        for member in tf.getmembers():
-            if member.issym() or member.islnk():  # skip links entirely
-                continue
-            target = safe_target_path(member.name, dest)
-            if target is None:
-                continue
-            _extract_member(tf, member, target)
+    with tarfile.open(tgz_path, mode="r|gz") as tf:
+        _extract_stream(tf, dest, sanitize_package_json=sanitize_package_json)
 
 
-def npm_view(version: str) -> dict[str, Any]:
+def npm_view(
+    version: str, fields: Sequence[str] = ("dist", "version")
+) -> dict[str, Any]:
     """Return npm view JSON for vercel@version.
 
+    Only the requested fields are fetched rather than the full registry
+    document; the defaults are all the vendoring needs. The result is always
+    an object keyed by field name, even when a single field is requested.
+
     Returns:
         dict: The npm view JSON.
 
     """
     cp = npm(
-        ["view", f"vercel@{version}", "--json"],
+        ["view", f"vercel@{version}", *fields, "--json"],
         return_completed_process=True,
         capture_output=True,
     )
-    return json.loads(cp.stdout)
+    data = _json_loads(cp.stdout)
+    # npm prints the bare value when only one field is selected
+    if len(fields) == 1:
+        return {fields[0]: data}
+    return data
 
 
-def verify_tgz(tgz_path: Path, integrity: str | None, shasum: str | None) -> None:
-    """Verify tarball against npm integrity or shasum if available.
+def _file_digest(path: Path, hasher_factory: Callable[[], Any]) -> bytes:
+    """Return the digest of the file at ``path`` using ``hasher_factory``.
+
+    On Python 3.11+ this delegates to :func:`hashlib.file_digest`, which runs the
+    read/update loop in C. The file is opened unbuffered since ``file_digest``
+    manages its own read buffer. Older versions hash a read-only memory map of
+    the file in a single ``update`` call.
+
+    Returns:
+        bytes: The raw digest of the file contents.
+
+    """
+    with path.open("rb", buffering=0) as f:
+        if sys.version_info >= (3, 11):
+            return hashlib.file_digest(f, hasher_factory).digest()
+        hasher = hasher_factory()
+        # Empty files cannot be memory-mapped
+        if os.fstat(f.fileno()).st_size:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                hasher.update(mm)
+        return hasher.digest()
+
+
+def _expected_digest(
+    integrity: str | None, shasum: str | None
+) -> tuple[Callable[[], Any], bytes, str] | None:
+    """Return the hasher factory, expected digest and mismatch message for npm dist.
 
     Raises:
-        RuntimeError: If the tarball is invalid.
+        RuntimeError: If the integrity or shasum value cannot be used.
+
+    Returns:
+        tuple | None: None if neither integrity nor shasum is available.
 
     """
     if integrity:
+        match = _INTEGRITY.match(integrity)
+        if match is None:
+            msg = f"Invalid integrity: {integrity}"
+            raise RuntimeError(msg)
+        algo = match.group(1).lower()
+        hasher_factory = _HASH_CTORS.get(algo)
+        if hasher_factory is None:
+            msg = f"Unsupported integrity algorithm: {algo}"
+            raise RuntimeError(msg)
         try:
-            algo, b64digest = integrity.split("-", 1)
-            algo = algo.lower()
-            expected = base64.b64decode(b64digest)
-        except Exception as exc:
+            expected = base64.b64decode(match.group(2), validate=True)
+        except binascii.Error as exc:
             msg = f"Invalid integrity: {integrity}"
             raise RuntimeError(msg) from exc
+        msg = f"Integrity verification failed for npm tarball: {integrity}"
+        return hasher_factory, expected, msg
+    if shasum:
+        msg = f"SHA1 verification failed for npm tarball: {shasum}"
         try:
-            hasher = getattr(hashlib, algo)()
-        except AttributeError as exc:
-            msg = f"Unsupported integrity algorithm: {algo}"
+            expected = bytes.fromhex(shasum)
+        except ValueError as exc:
             raise RuntimeError(msg) from exc
-        with tgz_path.open("rb") as f:
-            for chunk in iter(lambda: f.read(1024 * 1024), b""):
-                hasher.update(chunk)
-        if hasher.digest() != expected:
-            msg = f"Integrity verification failed for npm tarball: {integrity}"
-            raise RuntimeError(msg)
-        return
-    if shasum:
-        hasher = hashlib.sha1()  # noqa: S324 - npm publishes SHA1 shasum
-        with tgz_path.open("rb") as f:
-            for chunk in iter(lambda: f.read(1024 * 1024), b""):
-                hasher.update(chunk)
-        if hasher.hexdigest() != shasum:
-            msg = f"SHA1 verification failed for npm tarball: {shasum}"
-            raise RuntimeError(msg)
+        # npm publishes a SHA1 shasum
+        return hashlib.sha1, expected, msg
+    return None
+
+
+def verify_tgz(
+    tgz_path: Path, integrity: str | None = None, shasum: str | None = None
+) -> None:
+    """Verify tarball against npm integrity or shasum if available.
+
+    When both are given only integrity, the stronger hash, is checked.
+
+    Raises:
+        RuntimeError: If the tarball is invalid.
+
+    """
+    expected = _expected_digest(integrity, shasum)
+    if expected is None:
         return
+    hasher_factory, digest, msg = expected
+    if _file_digest(tgz_path, hasher_factory) != digest:
+        raise RuntimeError(msg)
+
+
+class _HashingReader(io.RawIOBase):
+    """Read-only stream that feeds every byte it returns into a hasher."""
+
+    def __init__(self, raw: io.BufferedReader, hasher: Any) -> None:  # noqa: ANN401
+        super().__init__()
+        self._raw = raw
+        self.hasher = hasher
+
+    def readable(self) -> bool:  # noqa: PLR6301
+        return True
+
+    def read(self, size: int = -1) -> bytes:
+        data = self._raw.read(size)
+        self.hasher.update(data)
+        return data
+
+
+def _extract_hashing(
+    tgz_path: Path,
+    dest: Path,
+    hasher: Any,  # noqa: ANN401
+    *,
+    sanitize_package_json: bool,
+) -> bytes:
+    with tgz_path.open("rb") as raw:
+        reader = _HashingReader(raw, hasher)
+        with tarfile.open(fileobj=reader, mode="r|gz") as tf:
+            _extract_stream(tf, dest, sanitize_package_json=sanitize_package_json)
+        # Hash any trailing bytes left after the end-of-archive marker
+        while reader.read(1024 * 1024):
+            pass
+    return reader.hasher.digest()
+
+
+def extract_and_verify(
+    tgz_path: Path,
+    dest: Path,
+    integrity: str | None = None,
+    shasum: str | None = None,
+    *,
+    sanitize_package_json: bool = False,
+) -> None:
+    """Extract a tarball into dest while verifying it in a single streaming pass.
+
+    The tarball is read from disk once: bytes are hashed as they are fed to the
+    gzip decompressor, and the digest is checked once the archive is consumed.
+    If verification or extraction fails, dest is removed. See extract_tgz for
+    sanitize_package_json.
+
+    Raises:
+        RuntimeError: If the tarball is invalid.
+
+    """
+    expected = _expected_digest(integrity, shasum)
+    try:
+        if expected is None:
+            extract_tgz(tgz_path, dest, sanitize_package_json=sanitize_package_json)
+            return
+        hasher_factory, digest, msg = expected
+        dest.mkdir(parents=True, exist_ok=True)
+        actual = _extract_hashing(
+            tgz_path,
+            dest,
+            hasher_factory(),
+            sanitize_package_json=sanitize_package_json,
+        )
+    except BaseException:
+        shutil.rmtree(dest, ignore_errors=True)
+        raise
+    if actual != digest:
+        shutil.rmtree(dest, ignore_errors=True)
+        raise RuntimeError(msg)
 
 
 def read_vendored_version() -> str:
     """Return the version of the vendored npm package.
 
+    The top-level ``version`` line is looked for in the first few KiB of
+    package.json before falling back to parsing the whole file.
+
     Returns:
         str: The version of the vendored npm package.
 
     """
     pkg_json = VENDOR_DIR / "package.json"
-    data = json.loads(pkg_json.read_text())
+    with pkg_json.open("rb") as f:
+        head = f.read(_VERSION_SCAN_BYTES)
+        match = _TOP_LEVEL_VERSION.search(head)
+        if match is not None:
+            return match.group(1).decode()
+        data = _json_loads(head + f.read())
     return str(data["version"])
 
 
+def resolve_latest_metadata() -> dict[str, Any]:
+    """Return the npm view JSON for the latest version of the npm package.
+
+    Returns:
+        dict: The npm view JSON of the latest version.
+
+    """
+    return npm_view("latest")
+
+
 def resolve_latest_version() -> str:
     """Return the latest version of the npm package.
 
@@ -235,58 +544,157 @@ def resolve_latest_version() -> str:
         str: The latest version of the npm package.
 
     """
-    meta = npm_view("latest")
+    meta = npm_view("latest", fields=("version",))
     return str(meta.get("version", ""))
 
 
-def update_vendor(version: str) -> None:
-    """Update the vendored npm package to the given version."""
-    with tempfile.TemporaryDirectory() as td:
+def _npm_install(work_dir: Path, version: str) -> None:
+    """Install the production dependencies of the package staged in work_dir.
+
+    Raises:
+        RuntimeError: If npm install fails.
+
+    """
+    # npm's progress output is discarded; stderr is only kept for errors
+    completed = npm(
+        args=["install", "--omit=dev", "--no-package-lock", "--ignore-scripts"],
+        return_completed_process=True,
+        cwd=str(work_dir),
+        env={"NODE_ENV": "production"},
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+    )
+    if completed.returncode != 0:
+        stderr = decode_maybe_bytes(getattr(completed, "stderr", b""))
+        msg = f"npm install failed for vercel@{version}: {stderr.strip()}"
+        raise RuntimeError(msg)
+
+
+def _stage_node_modules(work_dir: Path, version: str, moved: list[str]) -> None:
+    """Populate node_modules in work_dir, reusing the vendored one if possible.
+
+    A reused node_modules is recorded in moved so that _restore_vendor_dir can
+    put it back if a later step fails.
+    """
+    if _reuse_node_modules(work_dir):
+        moved.append("node_modules")
+        logger.info("Dependencies unchanged; reusing vendored node_modules")
+        return
+    _npm_install(work_dir, version)
+
+
+def _swap_into_vendor_dir(work_dir: Path, old_dir: Path, moved: list[str]) -> None:
+    """Replace VENDOR_DIR with work_dir using two renames, keeping .gitkeep.
+
+    Entries moved from VENDOR_DIR into work_dir are appended to moved so that
+    _restore_vendor_dir can put them back if a rename fails.
+    """
+    gitkeep = VENDOR_DIR / ".gitkeep"
+    if gitkeep.exists():
+        gitkeep.replace(work_dir / ".gitkeep")
+        moved.append(".gitkeep")
+    if VENDOR_DIR.exists():
+        VENDOR_DIR.replace(old_dir)
+    work_dir.replace(VENDOR_DIR)
+
+
+def _restore_vendor_dir(work_dir: Path, old_dir: Path, moved: Sequence[str]) -> None:
+    """Undo a partial update, putting the previous vendor tree back in place.
+
+    The entries named in moved are moved back from work_dir into VENDOR_DIR.
+    Errors are suppressed so that the original failure propagates.
+    """
+    if old_dir.exists() and not VENDOR_DIR.exists():
+        with suppress(OSError):
+            old_dir.replace(VENDOR_DIR)
+    if not VENDOR_DIR.is_dir():
+        return
+    for name in moved:
+        source, target = work_dir / name, VENDOR_DIR / name
+        if source.exists() and not target.exists():
+            with suppress(OSError):
+                source.replace(target)
+
+
+def _reuse_node_modules(work_dir: Path) -> bool:
+    """Move the vendored node_modules into work_dir if dependencies are unchanged.
+
+    Returns:
+        bool: Whether node_modules was moved, making npm install unnecessary.
+
+    """
+    old_modules = VENDOR_DIR / "node_modules"
+    if not old_modules.is_dir():
+        return False
+    try:
+        old_pkg = _json_loads((VENDOR_DIR / "package.json").read_bytes())
+        new_pkg = _json_loads((work_dir / "package.json").read_bytes())
+    except (OSError, ValueError):
+        return False
+    if old_pkg.get("dependencies") != new_pkg.get("dependencies"):
+        return False
+    old_modules.replace(work_dir / "node_modules")
+    return True
+
+
+def update_vendor(version: str, metadata: dict[str, Any] | None = None) -> str:
+    """Update the vendored npm package to the given version.
+
+    The package is staged next to VENDOR_DIR so that it can be swapped in with
+    a single directory rename rather than copied file by file. Pass the npm
+    view JSON of the version as metadata when it is already known to skip a
+    second ``npm view``. When the sanitized dependencies match the vendored
+    ones, the existing node_modules is moved over instead of running
+    ``npm install``.
+
+    If npm install fails (RuntimeError) or the staged tree cannot be moved
+    into place, the previous vendor directory, including a reused
+    node_modules, is restored before the error propagates.
+
+    Returns:
+        str: The vendored version, as resolved by npm.
+
+    """
+    VENDOR_DIR.parent.mkdir(parents=True, exist_ok=True)
+    staging_dir = tempfile.TemporaryDirectory(
+        dir=VENDOR_DIR.parent, prefix=f".{VENDOR_DIR.name}-"
+    )
+    with tempfile.TemporaryDirectory() as td, staging_dir as staging:
         tmp = Path(td)
-        metadata = npm_view(version)
-        tgz = npm_pack(version=version, out_dir=tmp)
-        verify_tgz(
+        if metadata is None:
+            # Both spawn npm and wait on the registry, so overlap them
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                metadata_future = executor.submit(npm_view, version)
+                tgz_future = executor.submit(npm_pack, version=version, out_dir=tmp)
+                metadata, tgz = metadata_future.result(), tgz_future.result()
+        else:
+            tgz = npm_pack(version=version, out_dir=tmp)
+
+        # SHA-512 integrity supersedes the legacy SHA-1 shasum
+        dist: dict[str, str | None] = metadata["dist"]
+        integrity = dist.get("integrity")
+        work_dir = Path(staging) / "package"
+        extract_and_verify(
             tgz,
-            integrity=metadata["dist"]["integrity"],
-            shasum=metadata["dist"]["shasum"],
+            work_dir,
+            integrity=integrity,
+            shasum=None if integrity else dist.get("shasum"),
+            sanitize_package_json=True,
         )
         logger.info("Verified npm tarball integrity")
 
-        work_dir = tmp / "work"
-        extract_tgz(tgz, work_dir)
-
-        pkg_json_path = work_dir / "package.json"
+        # Anything moved out of VENDOR_DIR is put back if a later step fails.
+        # The old tree is deleted with the staging directory, before this
+        # function returns.
+        moved: list[str] = []
+        old_dir = Path(staging) / "old"
         try:
-            pkg_data: dict[str, Any] = json.loads(pkg_json_path.read_text())
-            pkg_data = sanitize_package_data(pkg_data)
-            pkg_json_path.write_text(
-                json.dumps(pkg_data, indent=2, sort_keys=True) + "\n"
-            )
-            logger.info(
-                "Restricted dependencies to: %s",
-                ", ".join(sorted(pkg_data["dependencies"].keys())),
-            )
-        except Exception as exc:  # noqa: BLE001 - emit context then re-raise
-            logger.info("Warning: failed to sanitize package.json: %s", exc)
-
-        npm(
-            args=["install", "--omit=dev", "--no-package-lock", "--ignore-scripts"],
-            return_completed_process=False,
-            cwd=str(work_dir),
-            env={"NODE_ENV": "production"},
-            capture_output=True,
-        )
-
-        if VENDOR_DIR.exists():
-            for child in VENDOR_DIR.iterdir():
-                if child.name == ".gitkeep":
-                    continue
-                if child.is_dir():
-                    shutil.rmtree(child)
-                else:
-                    child.unlink()
-        VENDOR_DIR.mkdir(parents=True, exist_ok=True)
-        shutil.copytree(work_dir, VENDOR_DIR, dirs_exist_ok=True)
+            _stage_node_modules(work_dir, version, moved)
+            _swap_into_vendor_dir(work_dir, old_dir, moved)
+        except BaseException:
+            _restore_vendor_dir(work_dir, old_dir, moved)
+            raise
+    return str(metadata.get("version") or version)
 
 
 def write_github_outputs(**kwargs: str) -> None:
@@ -294,6 +702,9 @@ def write_github_outputs(**kwargs: str) -> None:
     out_path = os.environ.get("GITHUB_OUTPUT")
     if not out_path:
         return
-    lines = [f"{k}={v}" for k, v in kwargs.items()]
-    with Path(out_path).open("a", encoding="utf-8") as f:
-        f.write("\n".join(lines) + "\n")
+    data = "".join(f"{k}={v}\n" for k, v in kwargs.items()).encode("utf-8")
+    fd = os.open(out_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, data)
+    finally:
+        os.close(fd)